@@ -9,14 +9,21 @@ Designed for headless operation - no preview window.
 """
 
 import json
+import os
+import queue
 import signal
+import struct
 import sys
+import threading
 import time
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
-import cv2
+import depthai as dai
 import numpy as np
+import orjson
+import simplejpeg
 
 # Add hand_tracker to path
 sys.path.insert(0, str(Path(__file__).parent / "hand_tracker"))
@@ -43,10 +50,64 @@ BODY_KEYPOINT_NAMES = [
     "LEFT_ANKLE", "RIGHT_ANKLE",
 ]
 
+MAX_HANDS = 2
+
+# One fixed-size record per frame in landmarks.bin. Hand slot i holds hands[i]
+# of the matching JSONL frame line; missing hands/body are NaN (handedness -1).
+LANDMARK_RECORD = np.dtype([
+    ("handedness", "i1", (MAX_HANDS,)),
+    ("landmarks_2d", "<f4", (MAX_HANDS, len(HAND_LANDMARK_NAMES), 2)),
+    ("landmarks_3d", "<f4", (MAX_HANDS, len(HAND_LANDMARK_NAMES), 3)),
+    ("body_keypoints_2d", "<f4", (len(BODY_KEYPOINT_NAMES), 2)),
+    ("body_scores", "<f4", (len(BODY_KEYPOINT_NAMES),)),
+])
+HANDEDNESS_CODES = {"left": 0, "right": 1}
+
+# Landmark records are collected in memory and written this many frames at a time
+LANDMARK_BATCH = 64
+
+JPEG_QUALITY = 85
+
+# Encoded frames buffered on the host side of the OAK-D jpeg stream
+JPEG_QUEUE_SIZE = 4
+
+# rgb_frames.idx holds one (byte offset, byte size) entry per frame in the rgb file
+FRAME_INDEX_ENTRY = struct.Struct("<QQ")
+
+# Encoded frames are written to disk in batches of this many with a single writev()
+FRAME_BATCH_COUNT = 8
+
+FRAME_QUEUE_SIZE = 32
+
+# Raw frames waiting for host-side JPEG encoding; further frames are dropped
+ENCODE_QUEUE_SIZE = 4
+
+# --raw frames are ~6 MB each, so they are written one at a time with few in flight
+RAW_FRAME_BATCH_COUNT = 1
+RAW_FRAME_QUEUE_SIZE = 2
+
+# Initial capacity of the per-session frame timestamp array (~2 min at 30 FPS)
+TIMESTAMPS_INITIAL_SIZE = 4096
+
+# Serialized poses are buffered in memory and written out in chunks of this size
+POSES_BUFFER_SIZE = 64 * 1024
+
+# palm_xyz is stored as the tracker's ndarray and serialized natively by orjson
+POSE_JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE
+
+# Per-device (MxId) camera intrinsics, so calibration is only read from the OAK-D once
+INTRINSICS_CACHE_FILE = Path.home() / ".cache" / "pi-recorder" / "intrinsics.json"
+INTRINSICS_KEYS = ("fx", "fy", "cx", "cy", "width", "height")
+
 # Global flag for graceful shutdown
 running = True
 
 
+def _hms() -> str:
+    """Current local time as HH:MM:SS for log lines."""
+    return time.strftime("%H:%M:%S")
+
+
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully."""
     global running
@@ -54,17 +115,297 @@ def signal_handler(sig, frame):
     running = False
 
 
-def get_disk_usage_percent(path: Path) -> float:
-    """Get disk usage percentage for the given path."""
-    import shutil
-    total, used, free = shutil.disk_usage(path)
-    return (used / total) * 100
+class SequenceTrackingQueue:
+    """Wraps a depthai output queue and remembers the sequence number of the last message read."""
+
+    def __init__(self, queue):
+        self._queue = queue
+        self.last_seq = None
+
+    def get(self):
+        msg = self._queue.get()
+        self.last_seq = msg.getSequenceNum()
+        return msg
+
+    def tryGet(self):
+        msg = self._queue.tryGet()
+        if msg is not None:
+            self.last_seq = msg.getSequenceNum()
+        return msg
+
+    def __getattr__(self, name):
+        return getattr(self._queue, name)
+
+
+class RecorderHandTracker(HandTracker):
+    """HandTracker that also JPEG-encodes the color camera stream on the OAK-D.
+
+    Encoded frames come back on the "jpeg" output queue, so the Pi only has
+    to write bytes to disk instead of encoding each frame itself. The
+    tracker's own video queue and the jpeg queue drop frames independently,
+    so next_jpeg() matches them up by camera sequence number.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.q_video = SequenceTrackingQueue(self.q_video)
+        self.q_jpeg = self.device.getOutputQueue("jpeg", maxSize=JPEG_QUEUE_SIZE, blocking=True)
+        self._pending_jpeg = None
+
+    def next_jpeg(self):
+        """
+        Get the encoded JPEG for the frame last returned by next_frame().
+
+        Returns None if the encoder's output for that frame was lost.
+        """
+        seq = self.q_video.last_seq
+        while True:
+            msg = self._pending_jpeg if self._pending_jpeg is not None else self.q_jpeg.get()
+            self._pending_jpeg = None
+            msg_seq = msg.getSequenceNum()
+            if msg_seq == seq:
+                return msg.getData()
+            if msg_seq > seq:
+                # Already past this frame; keep it for the next call
+                self._pending_jpeg = msg
+                return None
+            # Older than the current frame (its video frame was dropped): discard
+
+    def create_pipeline(self):
+        pipeline = super().create_pipeline()
+        cam = next(n for n in pipeline.getAllNodes() if isinstance(n, dai.node.ColorCamera))
+
+        video_enc = pipeline.create(dai.node.VideoEncoder)
+        video_enc.setDefaultProfilePreset(self.internal_fps, dai.VideoEncoderProperties.Profile.MJPEG)
+        video_enc.setQuality(JPEG_QUALITY)
+        cam.video.link(video_enc.input)
+
+        jpeg_out = pipeline.create(dai.node.XLinkOut)
+        jpeg_out.setStreamName("jpeg")
+        video_enc.bitstream.link(jpeg_out.input)
+        return pipeline
+
+
+class FrameWriter:
+    """Appends encoded frames to the session video file from a background thread.
+
+    The capture loop queues frame bytes with write() (blocking once
+    queue_size frames are pending); the writer thread collects batch_count
+    of them and submits the batch with one os.writev() on a single
+    append-only fd, then records each frame's (offset, size) in the index
+    file. sync() makes everything queued so far durable. Write errors are
+    stored in `error` and later frames are discarded.
+    """
+
+    def __init__(
+        self,
+        video_path: Path,
+        index_path: Path,
+        batch_count: int = FRAME_BATCH_COUNT,
+        queue_size: int = FRAME_QUEUE_SIZE,
+    ):
+        self._fd = os.open(video_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self._index_fh = open(index_path, "wb")
+        self._offset = 0
+        self._batch_count = batch_count
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write(self, *parts):
+        """Queue one frame, given as one or more bytes-like parts (not copied; don't modify them)."""
+        self._queue.put([memoryview(part).cast("B") for part in parts])
+
+    def sync(self):
+        """Ask the writer thread to write out frames queued so far and fsync the files."""
+        self._queue.put(self._SYNC)
+
+    def close(self):
+        """Write out any pending frames and close the files."""
+        self._queue.put(None)
+        self._thread.join()
+        os.close(self._fd)
+        self._index_fh.close()
+
+    _SYNC = object()
+
+    def _run(self):
+        batch = []
+        while True:
+            item = self._queue.get()
+            if item is None or item is self._SYNC:
+                # End of session or sync request: write out the partial batch too
+                self._flush(batch, sync=item is self._SYNC)
+                batch = []
+                if item is None:
+                    return
+                continue
+            batch.append(item)
+            if len(batch) >= self._batch_count:
+                self._flush(batch)
+                batch = []
+
+    def _flush(self, batch, sync: bool = False):
+        if self.error is not None:
+            return
+        try:
+            if batch:
+                self._write_batch(batch)
+            if sync:
+                self._index_fh.flush()
+                os.fsync(self._fd)
+                os.fsync(self._index_fh.fileno())
+        except OSError as e:
+            self.error = e
+
+    def _write_batch(self, batch):
+        views = [part for parts in batch for part in parts]
+        written = os.writev(self._fd, views)
+        total = sum(len(v) for v in views)
+        while written < total:
+            # Short write (e.g. disk nearly full): finish the remainder piecewise
+            pending = memoryview(b"".join(views))[written:]
+            written += os.write(self._fd, pending)
+
+        for parts in batch:
+            size = sum(len(part) for part in parts)
+            self._index_fh.write(FRAME_INDEX_ENTRY.pack(self._offset, size))
+            self._offset += size
+
+
+class FrameEncoder:
+    """JPEG-encodes raw frames on a background thread and hands them to a FrameWriter.
+
+    With raw=True frames are stored uncompressed as binary PPM (P6) images
+    instead, so the rgb file is a plain multi-image PPM stream.
+
+    submit() never blocks the capture loop: when ENCODE_QUEUE_SIZE frames are
+    already waiting it returns False and the frame is dropped. Dropped frames
+    are written as empty (size 0) entries so the frame index stays aligned
+    with frame_idx in the poses file. Encoding errors are stored in `error`;
+    the thread then keeps draining the queue but discards frames.
+    """
+
+    def __init__(self, frame_writer: FrameWriter, raw: bool = False):
+        self._frame_writer = frame_writer
+        self._raw = raw
+        self._next_idx = 0
+        self._queue = queue.Queue(maxsize=ENCODE_QUEUE_SIZE)
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, frame: np.ndarray, frame_idx: int) -> bool:
+        """Queue a BGR frame for encoding. Returns False if it had to be dropped."""
+        try:
+            self._queue.put_nowait((frame, frame_idx))
+        except queue.Full:
+            return False
+        return True
+
+    def close(self, frame_count: int):
+        """Encode all queued frames, then mark any trailing dropped frames up to frame_count."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error is None:
+            self._skip_to(frame_count)
+
+    def _skip_to(self, frame_idx: int):
+        while self._next_idx < frame_idx:
+            self._frame_writer.write(b"")
+            self._next_idx += 1
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            frame, frame_idx = item
+            if self.error is None:
+                try:
+                    self._skip_to(frame_idx)
+                    if self._raw:
+                        self._write_ppm(frame)
+                    else:
+                        jpeg = simplejpeg.encode_jpeg(np.ascontiguousarray(frame), quality=JPEG_QUALITY, colorspace="BGR")
+                        self._frame_writer.write(jpeg)
+                    self._next_idx = frame_idx + 1
+                except Exception as e:
+                    self.error = e
+            del frame, item  # Release the frame while waiting for the next one
+
+    def _write_ppm(self, frame: np.ndarray):
+        h, w = frame.shape[:2]
+        # PPM is RGB: convert in one copy, then writev() the header and pixels as they are
+        rgb = np.ascontiguousarray(frame[..., ::-1])
+        self._frame_writer.write(b"P6\n%d %d\n255\n" % (w, h), rgb)
+
+
+def read_calibrated_intrinsics(device) -> Optional[dict]:
+    """
+    Get the 1920x1080 RGB intrinsics for this device, from the cache or its calibration.
+
+    Returns None if the calibration can't be read.
+    """
+    try:
+        with open(INTRINSICS_CACHE_FILE) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+    if not isinstance(cache, dict):
+        cache = {}
+
+    try:
+        mx_id = device.getMxId()
+        cached = cache.get(mx_id)
+        if isinstance(cached, dict) and all(isinstance(cached.get(key), (int, float)) for key in INTRINSICS_KEYS):
+            return cached
+        calib = device.readCalibration()
+        intrinsic_matrix = calib.getCameraIntrinsics(dai.CameraBoardSocket.CAM_A, 1920, 1080)
+    except Exception as e:
+        print(f"Could not get calibration: {e}")
+        return None
+
+    intrinsics = {
+        "fx": intrinsic_matrix[0][0],
+        "fy": intrinsic_matrix[1][1],
+        "cx": intrinsic_matrix[0][2],
+        "cy": intrinsic_matrix[1][2],
+        "width": 1920,
+        "height": 1080,
+    }
+
+    cache[mx_id] = intrinsics
+    try:
+        INTRINSICS_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        cache_tmp = INTRINSICS_CACHE_FILE.with_name(INTRINSICS_CACHE_FILE.name + ".tmp")
+        with open(cache_tmp, "w") as f:
+            json.dump(cache, f, indent=2)
+        os.replace(cache_tmp, INTRINSICS_CACHE_FILE)
+    except OSError as e:
+        print(f"Could not cache calibration: {e}")
+
+    return intrinsics
+
+
+def flush_poses(poses_fh, pose_buf: bytearray):
+    """Write buffered pose lines to disk and fsync (power-loss safe up to this point)."""
+    if not pose_buf:
+        return
+    poses_fh.write(pose_buf)  # Buffered handle: writes everything or raises
+    poses_fh.flush()
+    os.fsync(poses_fh.fileno())
+    pose_buf.clear()
 
 
 def record_session(
     output_dir: Path,
     max_duration: float = 3600.0,  # 1 hour max per session
     max_disk_usage: float = 90.0,  # Stop if disk > 90% full
+    host_encode: bool = False,  # Encode JPEGs on the Pi instead of the OAK-D
+    raw: bool = False,  # Store uncompressed PPM frames instead of JPEG
 ) -> bool:
     """
     Record a single session.
@@ -73,11 +414,12 @@ def record_session(
     """
     global running
 
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Initializing tracker...")
+    print(f"[{_hms()}] Initializing tracker...")
 
     # Initialize hand tracker BEFORE creating folder
     try:
-        tracker = HandTracker(
+        tracker_cls = HandTracker if host_encode or raw else RecorderHandTracker
+        tracker = tracker_cls(
             input_src="rgb",
             use_world_landmarks=True,
             xyz=True,
@@ -94,7 +436,7 @@ def record_session(
         return running  # Continue trying - DON'T create folder
 
     # Try to get first frame to verify camera is working
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Testing camera...")
+    print(f"[{_hms()}] Testing camera...")
     try:
         first_frame, _, _ = tracker.next_frame()
         if first_frame is None:
@@ -116,40 +458,27 @@ def record_session(
         time.sleep(5)
         return running  # DON'T create folder
 
+    # Don't pin the test frame for the whole session
+    del first_frame
+
     # Only create session folder AFTER we verify camera works
     output_dir.mkdir(parents=True, exist_ok=True)
-    rgb_dir = output_dir / "rgb_frames"
-    rgb_dir.mkdir(exist_ok=True)
-
-    print(f"[{datetime.now().strftime('%H:%M:%S')}] Started session: {output_dir.name}")
 
-    # Get camera intrinsics
-    intrinsics = {
-        "fx": tracker.resolution[0] * 0.8,
-        "fy": tracker.resolution[0] * 0.8,
-        "cx": tracker.resolution[0] / 2,
-        "cy": tracker.resolution[1] / 2,
-        "width": tracker.resolution[0],
-        "height": tracker.resolution[1],
-    }
+    print(f"[{_hms()}] Started session: {output_dir.name}")
 
-    try:
-        import depthai as dai
-        calib = tracker.device.readCalibration()
-        intrinsic_matrix = calib.getCameraIntrinsics(dai.CameraBoardSocket.CAM_A, 1920, 1080)
+    # Get camera intrinsics (approximate if the calibration is unavailable)
+    intrinsics = read_calibrated_intrinsics(tracker.device)
+    if intrinsics is None:
         intrinsics = {
-            "fx": intrinsic_matrix[0][0],
-            "fy": intrinsic_matrix[1][1],
-            "cx": intrinsic_matrix[0][2],
-            "cy": intrinsic_matrix[1][2],
-            "width": 1920,
-            "height": 1080,
+            "fx": tracker.resolution[0] * 0.8,
+            "fy": tracker.resolution[0] * 0.8,
+            "cx": tracker.resolution[0] / 2,
+            "cy": tracker.resolution[1] / 2,
+            "width": tracker.resolution[0],
+            "height": tracker.resolution[1],
         }
-    except Exception as e:
-        print(f"Could not get calibration: {e}")
 
-    with open(output_dir / "camera_info.json", "w") as f:
-        json.dump({"intrinsics": intrinsics}, f, indent=2)
+    rgb_file = "rgb_frames.ppm" if raw else "rgb_frames.mjpeg"
 
     # Write header info to poses file (will append frames as JSONL)
     poses_file = output_dir / "hand_poses.jsonl"
@@ -160,95 +489,219 @@ def record_session(
             "intrinsics": intrinsics,
             "landmark_names": HAND_LANDMARK_NAMES,
             "body_keypoint_names": BODY_KEYPOINT_NAMES,
+            "rgb_file": rgb_file,
+            "rgb_index_file": "rgb_frames.idx",
+            "rgb_index_entry": "uint64 little-endian (offset, size) per frame",
+            "landmarks_file": "landmarks.bin",
+            "landmarks_record": LANDMARK_RECORD.descr,
+            "handedness_codes": HANDEDNESS_CODES,
         }
         f.write(json.dumps(header) + "\n")
 
     frame_count = 0
-    timestamps = []
-    start_time = time.time()
-    last_status_time = start_time
+    # Doubled whenever it fills, so the initial size doesn't depend on --session-duration
+    timestamps = np.empty(TIMESTAMPS_INITIAL_SIZE, dtype=np.int64)
+    start_ns = time.monotonic_ns()
+    max_duration_ms = int(max_duration * 1000)
+    last_status_ms = 0
+
+    # Keep the poses file open for the whole session and batch writes through pose_buf
+    poses_fh = open(poses_file, "ab")
+    pose_buf = bytearray()
+
+    # All frames go into one MJPEG stream (concatenated JPEGs) or PPM stream plus an offset index
+    if raw:
+        frame_writer = FrameWriter(
+            output_dir / rgb_file,
+            output_dir / "rgb_frames.idx",
+            batch_count=RAW_FRAME_BATCH_COUNT,
+            queue_size=RAW_FRAME_QUEUE_SIZE,
+        )
+    else:
+        frame_writer = FrameWriter(output_dir / rgb_file, output_dir / "rgb_frames.idx")
+    frame_encoder = FrameEncoder(frame_writer, raw=raw) if host_encode or raw else None
+    dropped_frames = 0
+
+    # Landmark arrays go to a binary sidecar, one LANDMARK_RECORD per frame,
+    # filled in place in a batch buffer and written LANDMARK_BATCH frames at a time
+    landmarks_fh = open(output_dir / "landmarks.bin", "wb")
+    landmark_buf = np.empty(LANDMARK_BATCH, dtype=LANDMARK_RECORD)
+    empty_landmark_rec = np.empty((), dtype=LANDMARK_RECORD)
+    for name in LANDMARK_RECORD.names:
+        empty_landmark_rec[name] = -1 if name == "handedness" else np.nan
+    lm_handedness = landmark_buf["handedness"]
+    lm_2d = landmark_buf["landmarks_2d"]
+    lm_3d = landmark_buf["landmarks_3d"]
+    body_kp = landmark_buf["body_keypoints_2d"]
+    body_scores = landmark_buf["body_scores"]
+    landmarks_synced = 0  # Records of the current batch already on disk
+
+    # Per-frame JSONL record, reused every frame: frame_pose owns hands_data,
+    # which is refilled from a fixed pool of per-hand dicts
+    hands_data = []
+    hand_pool = [{} for _ in range(MAX_HANDS)]
+    frame_pose = {
+        "_type": "frame",
+        "frame_idx": 0,
+        "timestamp_ms": 0,
+        "hands": hands_data,
+        "has_body": False,
+    }
 
-    while running:
-        elapsed = time.time() - start_time
+    # Which optional attributes the tracker sets on hands/body is fixed by its
+    # configuration, so it is probed once on the first hand/body seen
+    hand_attrs = None
+    body_attrs = None
 
-        # Check max duration
-        if elapsed > max_duration:
-            print(f"Session duration limit reached ({max_duration}s)")
-            break
+    try:
+        while running:
+            timestamp_ms = (time.monotonic_ns() - start_ns) // 1_000_000
 
-        # Check disk space every 30 seconds
-        if time.time() - last_status_time > 30:
-            disk_usage = get_disk_usage_percent(output_dir)
-            if disk_usage > max_disk_usage:
-                print(f"Disk usage too high ({disk_usage:.1f}%), stopping")
-                running = False
+            # Check max duration
+            if timestamp_ms > max_duration_ms:
+                print(f"Session duration limit reached ({max_duration}s)")
                 break
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] Frame {frame_count}, Disk: {disk_usage:.1f}%")
-            last_status_time = time.time()
-
-        # Get next frame
-        try:
-            frame, hands, bag = tracker.next_frame()
-        except Exception as e:
-            print(f"Error getting frame: {e}")
-            break
 
-        if frame is None:
-            print("No frame received, ending session")
-            break
+            # Check disk space every 30 seconds
+            if timestamp_ms - last_status_ms > 30_000:
+                # Blocks reserved for root count as used, as they are unavailable to us
+                vfs = os.statvfs(output_dir)
+                disk_usage = 100.0 * (1 - vfs.f_bavail / vfs.f_blocks)
+                if disk_usage > max_disk_usage:
+                    print(f"Disk usage too high ({disk_usage:.1f}%), stopping")
+                    running = False
+                    break
+                print(f"[{_hms()}] Frame {frame_count}, Disk: {disk_usage:.1f}%")
+                try:
+                    flush_poses(poses_fh, pose_buf)
+                except OSError as e:
+                    print(f"Error writing poses: {e}")
+                    break
+                frame_writer.sync()
+                try:
+                    landmarks_fh.write(landmark_buf[landmarks_synced:frame_count % LANDMARK_BATCH].tobytes())
+                    landmarks_fh.flush()
+                    os.fsync(landmarks_fh.fileno())
+                except OSError as e:
+                    print(f"Error writing landmarks: {e}")
+                    break
+                landmarks_synced = frame_count % LANDMARK_BATCH
+                last_status_ms = timestamp_ms
+
+            # Get next frame
+            try:
+                frame, hands, bag = tracker.next_frame()
+            except Exception as e:
+                print(f"Error getting frame: {e}")
+                break
 
-        timestamp_ms = int(elapsed * 1000)
-
-        # Process hands
-        hands_data = []
-        for hand in hands:
-            hand_data = {
-                "handedness": hand.label.capitalize(),
-                "confidence": float(hand.lm_score),
-            }
-
-            if hasattr(hand, 'landmarks') and hand.landmarks is not None:
-                hand_data["landmarks_2d"] = hand.landmarks.tolist()
-            else:
-                hand_data["landmarks_2d"] = []
-
-            if hasattr(hand, 'world_landmarks') and hand.world_landmarks is not None:
-                hand_data["landmarks_3d"] = hand.world_landmarks.tolist()
-            else:
-                hand_data["landmarks_3d"] = []
-
-            if hasattr(hand, 'xyz') and hand.xyz is not None:
-                xyz = hand.xyz
-                hand_data["palm_xyz"] = xyz.tolist() if hasattr(xyz, 'tolist') else list(xyz)
-
-            hands_data.append(hand_data)
-
-        # Process body
-        body_data = None
-        body = bag.get("body", None) if bag else None
-        if body is not None and hasattr(body, 'keypoints'):
-            body_data = {
-                "keypoints_2d": body.keypoints.tolist(),
-                "scores": body.scores.tolist() if hasattr(body, 'scores') else [],
-            }
-
-        # Save frame (use JPEG for smaller files on Pi)
-        frame_name = f"frame_{frame_count:06d}"
-        cv2.imwrite(str(rgb_dir / f"{frame_name}.jpg"), frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-
-        # Write pose immediately to JSONL (power-loss safe)
-        frame_pose = {
-            "_type": "frame",
-            "frame_idx": frame_count,
-            "timestamp_ms": timestamp_ms,
-            "hands": hands_data,
-            "body": body_data,
-        }
-        with open(poses_file, "a") as f:
-            f.write(json.dumps(frame_pose) + "\n")
+            if frame is None:
+                print("No frame received, ending session")
+                break
 
-        timestamps.append(timestamp_ms)
-        frame_count += 1
+            slot = frame_count % LANDMARK_BATCH
+            landmark_buf[slot] = empty_landmark_rec
+
+            # Process hands
+            hands_data.clear()
+            for i, hand in enumerate(hands[:MAX_HANDS]):
+                hand_data = hand_pool[i]
+                hand_data["handedness"] = hand.label.capitalize()
+                hand_data["confidence"] = float(hand.lm_score)
+                lm_handedness[slot, i] = HANDEDNESS_CODES.get(hand.label, -1)
+
+                if hand_attrs is None:
+                    hand_attrs = (
+                        hasattr(hand, 'landmarks'),
+                        hasattr(hand, 'world_landmarks'),
+                        hasattr(hand, 'xyz'),
+                    )
+                if hand_attrs[0] and hand.landmarks is not None:
+                    np.copyto(lm_2d[slot, i], hand.landmarks)
+
+                if hand_attrs[1] and hand.world_landmarks is not None:
+                    np.copyto(lm_3d[slot, i], hand.world_landmarks)
+
+                if hand_attrs[2] and hand.xyz is not None:
+                    hand_data["palm_xyz"] = hand.xyz
+                else:
+                    hand_data.pop("palm_xyz", None)
+
+                hands_data.append(hand_data)
+
+            # Process body
+            has_body = False
+            body = bag.get("body", None) if bag else None
+            if body is not None and body_attrs is None:
+                body_attrs = (hasattr(body, 'keypoints'), hasattr(body, 'scores'))
+            if body is not None and body_attrs[0]:
+                has_body = True
+                np.copyto(body_kp[slot], body.keypoints)
+                if body_attrs[1]:
+                    np.copyto(body_scores[slot], body.scores)
+
+            # Save frame (use JPEG for smaller files on Pi)
+            if frame_writer.error is not None:
+                print(f"Error writing frames: {frame_writer.error}")
+                break
+            if frame_encoder is not None and frame_encoder.error is not None:
+                print(f"Error encoding frames: {frame_encoder.error}")
+                break
+            if frame_encoder is None:
+                jpeg = tracker.next_jpeg()
+                if jpeg is None:
+                    frame_writer.write(b"")  # Keep the index aligned with frame_idx
+                    dropped_frames += 1
+                else:
+                    frame_writer.write(jpeg)
+            elif not frame_encoder.submit(frame, frame_count):
+                dropped_frames += 1
+
+            # Buffer pose as a JSONL line (written out every POSES_BUFFER_SIZE bytes)
+            frame_pose["frame_idx"] = frame_count
+            frame_pose["timestamp_ms"] = timestamp_ms
+            frame_pose["has_body"] = has_body
+            pose_buf += orjson.dumps(frame_pose, option=POSE_JSON_OPTIONS)
+
+            if frame_count == len(timestamps):
+                timestamps = np.concatenate([timestamps, np.empty_like(timestamps)])
+            timestamps[frame_count] = timestamp_ms
+            frame_count += 1
+
+            # Landmarks go out a whole batch at a time (a buffered write: all of it or an error)
+            if slot == LANDMARK_BATCH - 1:
+                try:
+                    landmarks_fh.write(landmark_buf[landmarks_synced:].tobytes())
+                except OSError as e:
+                    print(f"Error writing landmarks: {e}")
+                    break
+                landmarks_synced = 0
+
+            if len(pose_buf) >= POSES_BUFFER_SIZE:
+                try:
+                    flush_poses(poses_fh, pose_buf)
+                except OSError as e:
+                    print(f"Error writing poses: {e}")
+                    break
+
+            # Drop our reference before the next next_frame() so the allocator
+            # can hand the same block back instead of holding two frames at once
+            del frame
+    finally:
+        if frame_encoder is not None:
+            frame_encoder.close(frame_count)
+        frame_writer.close()
+        try:
+            landmarks_fh.write(landmark_buf[landmarks_synced:frame_count % LANDMARK_BATCH].tobytes())
+            landmarks_fh.close()
+        except OSError as e:
+            print(f"Error writing landmarks: {e}")
+        # Last, so a failing poses write can't keep queued frames or landmarks from being saved
+        try:
+            flush_poses(poses_fh, pose_buf)
+            poses_fh.close()
+        except OSError as e:
+            print(f"Error writing poses: {e}")
 
     # Cleanup tracker
     try:
@@ -258,17 +711,23 @@ def record_session(
 
     # Save final metadata (poses already saved incrementally to JSONL)
     if frame_count > 0:
-        actual_duration = timestamps[-1] / 1000.0 if timestamps else 0
+        actual_duration = timestamps[frame_count - 1] / 1000.0
 
-        with open(output_dir / "metadata.json", "w") as f:
+        # Write to a temp file and rename so metadata.json is either complete or absent
+        metadata_tmp = output_dir / "metadata.json.tmp"
+        with open(metadata_tmp, "w") as f:
             json.dump({
                 "recording_date": datetime.now().isoformat(),
                 "duration_seconds": actual_duration,
                 "frame_count": frame_count,
                 "fps": frame_count / actual_duration if actual_duration > 0 else 0,
+                "dropped_frames": dropped_frames,
             }, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(metadata_tmp, output_dir / "metadata.json")
 
-        print(f"Session complete: {frame_count} frames, {actual_duration:.1f}s")
+        print(f"Session complete: {frame_count} frames, {actual_duration:.1f}s, {dropped_frames} dropped")
     else:
         print("No frames recorded in this session")
 
@@ -285,6 +744,10 @@ def main():
                         help="Max duration per session in seconds (default: 1 hour)")
     parser.add_argument("--max-disk-usage", type=float, default=90.0,
                         help="Stop recording if disk usage exceeds this percent")
+    parser.add_argument("--host-encode", action="store_true",
+                        help="Encode JPEGs on the Pi instead of the OAK-D hardware encoder")
+    parser.add_argument("--raw", action="store_true",
+                        help="Store uncompressed PPM frames (no encoding; ~6 MB/frame, needs a fast SSD)")
     args = parser.parse_args()
 
     # Setup signal handlers
@@ -312,6 +775,8 @@ def main():
             session_dir,
             max_duration=args.session_duration,
             max_disk_usage=args.max_disk_usage,
+            host_encode=args.host_encode,
+            raw=args.raw,
         )
 
         if not should_continue: